@@ -0,0 +1,56 @@
+# cython: language_level=3, wraparound=False, freethreading_compatible=True
+from cpython.array cimport array, clone
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+from libc.stdint cimport int16_t, int32_t, int64_t, uint32_t, uint64_t
+
+from struct import error as struct_error
+
+
+cdef inline int16_t _read_h(const unsigned char[::1] buf, Py_ssize_t off):
+    return <int16_t>((buf[off] << 8) | buf[off + 1])
+
+
+cdef inline int32_t _read_i(const unsigned char[::1] buf, Py_ssize_t off):
+    return <int32_t>(
+        (<uint32_t>buf[off] << 24) | (<uint32_t>buf[off + 1] << 16) | (<uint32_t>buf[off + 2] << 8) | buf[off + 3]
+    )
+
+
+cdef inline int64_t _read_q(const unsigned char[::1] buf, Py_ssize_t off):
+    return <int64_t>((<uint64_t><uint32_t>_read_i(buf, off) << 32) | <uint32_t>_read_i(buf, off + 4))
+
+
+cpdef tuple parse_begin(const unsigned char[::1] buf):
+    if buf.shape[0] < 21:
+        raise struct_error("Begin message needs 21 bytes, got %d" % buf.shape[0])
+    return _read_q(buf, 1), _read_q(buf, 9), _read_i(buf, 17)
+
+
+cpdef tuple parse_commit(const unsigned char[::1] buf):
+    if buf.shape[0] < 26:
+        raise struct_error("Commit message needs 26 bytes, got %d" % buf.shape[0])
+    return <signed char>buf[1], _read_q(buf, 2), _read_q(buf, 10), _read_q(buf, 18)
+
+
+cpdef tuple read_tuple_data(const unsigned char[::1] buf, Py_ssize_t off):
+    cdef int16_t nr_columns = _read_h(buf, off)
+    cdef Py_ssize_t i
+    cdef unsigned char col_type
+    cdef int32_t length
+    cdef bytearray types = bytearray(nr_columns)
+    cdef array lengths = clone(array("i"), nr_columns, zero=True)
+    cdef list values = [None] * nr_columns
+    off += 2
+    for i in range(nr_columns):
+        col_type = buf[off]
+        off += 1
+        types[i] = col_type
+        if col_type == 0x74:  # t
+            length = _read_i(buf, off)
+            off += 4
+            if length < 0 or off + length > buf.shape[0]:
+                raise ValueError("Column length %d overruns the payload" % length)
+            lengths.data.as_ints[i] = length
+            values[i] = PyUnicode_DecodeUTF8(<const char*>&buf[0] + off, length, NULL)
+            off += length
+    return nr_columns, bytes(types), lengths, values, off
@@ -1,26 +1,166 @@
 import psycopg2
 import psycopg2.extras
 from psycopg2.extras import LogicalReplicationConnection, StopReplication, ReplicationMessage
+import logging
+import os
+import select
 import struct
-import io
+import sys
+import time
+from array import array
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from abc import ABC
-
-
-@dataclass(frozen=True)
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+logger = logging.getLogger(__name__)
+
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+_TAG_BEGIN = 0x42  # B
+_TAG_COMMIT = 0x43  # C
+_TAG_RELATION = 0x52  # R
+_TAG_UPDATE = 0x55  # U
+_TAG_INSERT = 0x49  # I
+_TAG_DELETE = 0x44  # D
+
+_S_BEGIN = struct.Struct(">qqi")
+_S_COMMIT = struct.Struct(">bqqq")
+# Single ints go through unpack_from too: int.from_bytes on a memoryview
+# slice measured about 3x slower, as the slice itself allocates.
+_S_I = struct.Struct(">i")
+_S_H = struct.Struct(">h")
+_S_C = struct.Struct(">c")
+_S_CHANGE_HDR = struct.Struct(">ic")
+_S_RELATION_COLUMN = struct.Struct(">Ii")
+
+try:
+    from _cdecode import parse_begin as _parse_begin, parse_commit as _parse_commit, read_tuple_data as _c_read_tuple_data
+except ImportError:
+    _parse_begin = _parse_commit = _c_read_tuple_data = None
+
+# Below this many columns the cost of wrapping the payload in an ndarray
+# outweighs what the JIT-compiled scan saves: on CPython 3.11 with numba 0.68
+# the two paths break even around 24-32 columns, and the JIT is ~10% faster
+# at 40, ~20% at 64 and ~35% at 200 or more.
+_JIT_MIN_COLUMNS = 40
+
+_TYPE_NULL = "null"
+_TYPE_TOAST = "toast"
+_TYPE_TEXT = "text"
+_COLUMN_TYPES = {0x6E: _TYPE_NULL, 0x75: _TYPE_TOAST, 0x74: _TYPE_TEXT}
+_COLUMN_TAGS = {column_type: tag for tag, column_type in _COLUMN_TYPES.items()}
+
+
+@dataclass(frozen=True, slots=True, init=False, repr=False)
 class TupleData:
     nr_columns: int
-    columns: list
+    types: bytes
+    lengths: array
+    values: list
+
+    def __init__(self, nr_columns: int, types: bytes = b"", lengths: array = None, values: list = None, columns: list = None) -> None:
+        if columns is not None:
+            types = bytes(_COLUMN_TAGS[column.type] for column in columns)
+            lengths = array("i", [column.length for column in columns])
+            values = [column.value for column in columns]
+        object.__setattr__(self, "nr_columns", nr_columns)
+        object.__setattr__(self, "types", types)
+        object.__setattr__(self, "lengths", array("i") if lengths is None else lengths)
+        object.__setattr__(self, "values", [] if values is None else values)
+
+    def __getitem__(self, i: int) -> "ColumnData":
+        tag = self.types[i]
+        return ColumnData(type=_COLUMN_TYPES.get(tag) or chr(tag), length=self.lengths[i], value=self.values[i])
+
+    @property
+    def columns(self) -> list:
+        # Builds a new list of ColumnData on every access; use td[i] for single columns.
+        return [self[i] for i in range(len(self.types))]
+
+    def __repr__(self) -> str:
+        return f"TupleData(nr_columns={self.nr_columns}, columns={self.columns})"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class ColumnData:
     type: str
     length: int = 0
     value: any = None
 
 
+if numba is not None:
+    @numba.njit(cache=True)
+    def _scan_tuple(buf, off):
+        # Numba does not bounds-check, so every read is checked against the end.
+        end = buf.shape[0]
+        if off + 2 > end:
+            raise ValueError("Tuple data overruns the payload")
+        nr_columns = (np.int64(buf[off]) << 8) | np.int64(buf[off + 1])
+        off += 2
+        types = np.empty(nr_columns, dtype=np.uint8)
+        offs = np.zeros(nr_columns, dtype=np.int64)
+        lens = np.zeros(nr_columns, dtype=np.int32)
+        for i in range(nr_columns):
+            if off + 1 > end:
+                raise ValueError("Tuple data overruns the payload")
+            col_type = buf[off]
+            off += 1
+            types[i] = col_type
+            if col_type == 0x74:  # t
+                if off + 4 > end:
+                    raise ValueError("Tuple data overruns the payload")
+                length = (
+                    (np.int64(buf[off]) << 24)
+                    | (np.int64(buf[off + 1]) << 16)
+                    | (np.int64(buf[off + 2]) << 8)
+                    | np.int64(buf[off + 3])
+                )
+                off += 4
+                if off + length > end:
+                    raise ValueError("Column length overruns the payload")
+                offs[i] = off
+                lens[i] = length
+                off += length
+        return types, offs, lens, off
+else:
+    _scan_tuple = None
+
+
+def process_timestamps(ts_microsec: "np.ndarray") -> "np.ndarray":
+    # Vectorized WALMessage._process_timestamp; the result is naive UTC datetime64[us].
+    if np is None:
+        raise ImportError("process_timestamps requires numpy")
+    return np.datetime64("2000-01-01T00:00:00", "us") + ts_microsec.astype("timedelta64[us]")
+
+
+def _decode_text(chunks: list) -> list:
+    # One decode over the NUL-joined chunks instead of one per column; pgoutput
+    # text values never contain NUL, but fall back if one somehow does.
+    joined = b"\x00".join(chunks)
+    if joined.count(0) != len(chunks) - 1:
+        return [str(chunk, "utf-8") for chunk in chunks]
+    return joined.decode("utf-8").split("\x00")
+
+
+@dataclass(frozen=True, slots=True)
+class RelationColumn:
+    flags: int
+    name: str
+    type_oid: int
+    type_modifier: int
+
+
 class ChangeEvent:
     def __repr__(self) -> str:
         return f"""
@@ -29,33 +169,65 @@ class ChangeEvent:
 
 
 class WALMessage(ABC):
-    def _process_timestamp(self, ts_microsec: int) -> datetime:
-        ts = datetime(2000, 1, 1, 0, 0, 0, 0, tzinfo=timezone.utc)
-        return ts + timedelta(microseconds=ts_microsec)
-
-    def read_tuple_data(self, buffer: io.BytesIO) -> TupleData:
-        columns = []
-        nr_columns = struct.unpack(">h", buffer.read(2))[0]
-        for _ in range(nr_columns):
-            col_type = struct.unpack(">c", buffer.read(1))[0].decode()
-            match col_type:
-                case "n":
-                    columns.append(ColumnData(type="null"))
-                case "u":
-                    columns.append(ColumnData(type="toast"))
-                case "t":
-                    column_data_length = struct.unpack(">i", buffer.read(4))[0]
-                    column_value = struct.unpack(f">{column_data_length}s", buffer.read(column_data_length))[0].decode()
-                    columns.append(ColumnData(type="text", length=column_data_length, value=column_value))
-        return TupleData(nr_columns=nr_columns, columns=columns)
+    @staticmethod
+    def _process_timestamp(ts_microsec: int) -> datetime:
+        return _PG_EPOCH + timedelta(microseconds=ts_microsec)
+
+    def read_tuple_data(self, mv: memoryview, off: int) -> tuple[TupleData, int]:
+        if _c_read_tuple_data is not None:
+            nr_columns, types, lengths, values, off = _c_read_tuple_data(mv, off)
+            return TupleData(nr_columns=nr_columns, types=types, lengths=lengths, values=values), off
+        nr_columns, = _S_H.unpack_from(mv, off)
+        if _scan_tuple is not None and nr_columns >= _JIT_MIN_COLUMNS:
+            return self._read_tuple_data_jit(mv, off)
+        off += 2
+        types = bytearray(nr_columns)
+        lengths = array("i", [0]) * nr_columns
+        values = [None] * nr_columns
+        text_idx = []
+        text_chunks = []
+        for i in range(nr_columns):
+            col_type = mv[off]
+            off += 1
+            types[i] = col_type
+            if col_type == 0x74:  # t
+                column_data_length, = _S_I.unpack_from(mv, off)
+                off += 4
+                if column_data_length < 0 or off + column_data_length > len(mv):
+                    raise ValueError("Column length %d overruns the payload" % column_data_length)
+                lengths[i] = column_data_length
+                text_idx.append(i)
+                text_chunks.append(mv[off:off + column_data_length])
+                off += column_data_length
+        if text_chunks:
+            for i, value in zip(text_idx, _decode_text(text_chunks)):
+                values[i] = value
+        return TupleData(nr_columns=nr_columns, types=bytes(types), lengths=lengths, values=values), off
+
+    def _read_tuple_data_jit(self, mv: memoryview, off: int) -> tuple[TupleData, int]:
+        types, offs, lens, off = _scan_tuple(np.frombuffer(mv, dtype=np.uint8), off)
+        # Plain ints slice the view far faster than numpy scalars.
+        offs = offs.tolist()
+        lens = lens.tolist()
+        values = [None] * len(types)
+        text_idx = [i for i, col_type in enumerate(types.tolist()) if col_type == 0x74]
+        if text_idx:
+            text_chunks = [mv[offs[i]:offs[i] + lens[i]] for i in text_idx]
+            for i, value in zip(text_idx, _decode_text(text_chunks)):
+                values[i] = value
+        return TupleData(nr_columns=len(types), types=types.tobytes(), lengths=array("i", lens), values=values), off
 
 
 class Begin(WALMessage):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "B":
-            raise ValueError("Invalid message type. Expected 'B', got '%s'" % payload[:1].decode("utf-8"))
-
-        self.lsn, self.commit_ts, self.tx_id = struct.unpack(">qqi", payload[1:])
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_BEGIN:
+            raise ValueError("Invalid message type. Expected 'B', got '%s'" % chr(mv[0]))
+
+        if _parse_begin is None:
+            self.lsn, self.commit_ts, self.tx_id = _S_BEGIN.unpack_from(mv, 1)
+        else:
+            self.lsn, self.commit_ts, self.tx_id = _parse_begin(mv)
         self.commit_ts = self._process_timestamp(self.commit_ts)
 
     def __repr__(self) -> str:
@@ -63,10 +235,14 @@ class Begin(WALMessage):
 
 class Commit(WALMessage):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "C":
-            raise ValueError("Invalid message type. Expected 'C', got '%s'" % payload[:1].decode("utf-8"))
-
-        self.flags, self.lsn, self.commit_lsn, self.commit_ts = struct.unpack(">bqqq", payload[1:])
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_COMMIT:
+            raise ValueError("Invalid message type. Expected 'C', got '%s'" % chr(mv[0]))
+
+        if _parse_commit is None:
+            self.flags, self.lsn, self.commit_lsn, self.commit_ts = _S_COMMIT.unpack_from(mv, 1)
+        else:
+            self.flags, self.lsn, self.commit_lsn, self.commit_ts = _parse_commit(mv)
         self.commit_ts = self._process_timestamp(self.commit_ts)
 
     def __repr__(self) -> str:
@@ -74,101 +250,175 @@ class Commit(WALMessage):
 
 class Relation(WALMessage):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "R":
-            raise ValueError("Invalid message type. Expected 'R', got '%s'" % payload[:1].decode("utf-8"))
-        buffer = io.BytesIO(payload[1:])
-        self.relation_id = struct.unpack(">i", buffer.read(4))[0]
-        self.namespace = struct.unpack(">s", buffer.read(1))[0].decode()
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_RELATION:
+            raise ValueError("Invalid message type. Expected 'R', got '%s'" % chr(mv[0]))
+        self.relation_id, = _S_I.unpack_from(mv, 1)
+        end = payload.index(0, 5)
+        self.namespace = str(mv[5:end], "utf-8")
+        off = end + 1
+        end = payload.index(0, off)
+        self.name = str(mv[off:end], "utf-8")
+        off = end + 1
+        self.replica_identity = chr(mv[off])
+        nr_columns, = _S_H.unpack_from(mv, off + 1)
+        off += 3
+        self.columns = []
+        for _ in range(nr_columns):
+            flags = mv[off]
+            end = payload.index(0, off + 1)
+            name = str(mv[off + 1:end], "utf-8")
+            type_oid, type_modifier = _S_RELATION_COLUMN.unpack_from(mv, end + 1)
+            off = end + 1 + _S_RELATION_COLUMN.size
+            self.columns.append(RelationColumn(flags=flags, name=name, type_oid=type_oid, type_modifier=type_modifier))
+
+    def __repr__(self) -> str:
+        return (
+            f"Relation(relation_id={self.relation_id}, namespace={self.namespace}, name={self.name}, "
+            f"replica_identity={self.replica_identity}, columns={self.columns})"
+        )
 
 
 class Update(WALMessage, ChangeEvent):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "U":
-            raise ValueError("Invalid message type. Expected 'U', got '%s'" % payload[:1].decode("utf-8"))
-        buffer = io.BytesIO(payload[1:])
-        self.relation_id = struct.unpack(">i", buffer.read(4))[0]
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_UPDATE:
+            raise ValueError("Invalid message type. Expected 'U', got '%s'" % chr(mv[0]))
+        self.relation_id, identifier = _S_CHANGE_HDR.unpack_from(mv, 1)
+        off = 1 + _S_CHANGE_HDR.size
         self.before = None
 
-        identifier = struct.unpack(">s", buffer.read(1))[0].decode()
-
-        if identifier in ("K", "O"):
-            self.before = self.read_tuple_data(buffer)
-            identifier = struct.unpack(">s", buffer.read(1))[0].decode()
-            if identifier != "N":
-                raise ValueError("Invalid message type. Expected 'N', got '%s'" % identifier)
+        if identifier in (b"K", b"O"):
+            self.before, off = self.read_tuple_data(mv, off)
+            identifier, = _S_C.unpack_from(mv, off)
+            off += 1
+            if identifier != b"N":
+                raise ValueError("Invalid message type. Expected 'N', got '%s'" % identifier.decode())
 
-        self.after = self.read_tuple_data(buffer)
+        self.after, off = self.read_tuple_data(mv, off)
 
 
 class Insert(WALMessage, ChangeEvent):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "I":
-            raise ValueError("Invalid message type. Expected 'I', got '%s'" % payload[:1].decode("utf-8"))
-        buffer = io.BytesIO(payload[1:])
-        self.relation_id = struct.unpack(">i", buffer.read(4))[0]
-        identifier = struct.unpack(">s", buffer.read(1))[0].decode()
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_INSERT:
+            raise ValueError("Invalid message type. Expected 'I', got '%s'" % chr(mv[0]))
+        self.relation_id, identifier = _S_CHANGE_HDR.unpack_from(mv, 1)
+        off = 1 + _S_CHANGE_HDR.size
 
-        if identifier != "N":
-            raise ValueError("Invalid message type. Expected 'N', got '%s'" % identifier)
+        if identifier != b"N":
+            raise ValueError("Invalid message type. Expected 'N', got '%s'" % identifier.decode())
 
         self.before = None
-        self.after = self.read_tuple_data(buffer)
+        self.after, off = self.read_tuple_data(mv, off)
 
 
 class Delete(WALMessage, ChangeEvent):
     def __init__(self, payload: bytes) -> None:
-        if payload[:1].decode("utf-8") != "D":
-            raise ValueError("Invalid message type. Expected 'D', got '%s'" % payload[:1].decode("utf-8"))
-        buffer = io.BytesIO(payload[1:])
-        self.relation_id = struct.unpack(">i", buffer.read(4))[0]
-        identifier = struct.unpack(">s", buffer.read(1))[0].decode()
+        mv = memoryview(payload)
+        if __debug__ and mv[0] != _TAG_DELETE:
+            raise ValueError("Invalid message type. Expected 'D', got '%s'" % chr(mv[0]))
+        self.relation_id, identifier = _S_CHANGE_HDR.unpack_from(mv, 1)
+        off = 1 + _S_CHANGE_HDR.size
 
-        if identifier not in ("K", "O"):
-            raise ValueError("Invalid message type. Expected 'K' or 'O', got '%s'" % identifier)
+        if identifier not in (b"K", b"O"):
+            raise ValueError("Invalid message type. Expected 'K' or 'O', got '%s'" % identifier.decode())
 
-        self.before = self.read_tuple_data(buffer)
+        self.before, off = self.read_tuple_data(mv, off)
         self.after = None
 
+
+_DISPATCH = {
+    _TAG_BEGIN: Begin,
+    _TAG_UPDATE: Update,
+    _TAG_INSERT: Insert,
+    _TAG_DELETE: Delete,
+    _TAG_COMMIT: Commit,
+    _TAG_RELATION: Relation,
+}
+_CHANGE_EVENTS = {Update, Insert, Delete}
+
+_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)
+
+
+def _parse_payload(payload: bytes):
+    cls = _DISPATCH.get(payload[0])
+    return cls(payload) if cls is not None else None
+
+
+# Pools are kept for the life of the process so batches don't pay thread start-up.
+_executors = {}
+
+
+def parse_payloads(payloads: list, workers: int | None = None) -> list:
+    # Messages share no parser state, so on free-threaded builds (3.13t) they
+    # can be decoded in parallel; with the GIL, threads would only add overhead.
+    if workers is None:
+        workers = 1 if _gil_enabled() else os.cpu_count() or 1
+    if workers <= 1:
+        return [_parse_payload(payload) for payload in payloads]
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = _executors.setdefault(workers, ThreadPoolExecutor(max_workers=workers))
+    return list(executor.map(_parse_payload, payloads))
+
+
 class FiniteConsumer:
-    def __init__(self, n: int, ack: bool = False) -> None:
+    def __init__(self, n: int, ack: bool = False, ack_every: int = 100, ack_interval: float = 1.0) -> None:
         self.n = n
         self.ack = ack
+        self._ack_every = ack_every
+        self._ack_interval = ack_interval
+        self._since_ack = 0
+        self._highest_lsn = 0
+        self._last_ack = time.monotonic()
 
     def __call__(self, message: ReplicationMessage):
         self.process_message(message)
 
+    def consume(self, cursor) -> None:
+        # Like cursor.consume_stream(self), but wakes up every ack_interval while
+        # the stream is idle so batched feedback is not held back until the next message.
+        try:
+            while True:
+                message = cursor.read_message()
+                if message is not None:
+                    self(message)
+                    continue
+                if self.ack and self._since_ack and time.monotonic() - self._last_ack > self._ack_interval:
+                    self._send_feedback(cursor)
+                select.select([cursor], [], [], self._ack_interval)
+        except StopReplication:
+            pass
+
     def process_message(self, message: ReplicationMessage):
-        match message.payload[:1].decode("utf-8"):
-            case "B":
-                print(f"Begin Raw: {message.wal_end} {message.data_start}")
-                msg = Begin(message.payload)
-                print(msg)
-            case "U":
-                print(f"Update Raw: {message.wal_end} {message.data_start}")
-                msg = Update(message.payload)
-                print(msg)
+        cls = _DISPATCH.get(message.payload[0])
+        if cls is None:
+            logger.info("Skipping message lsn%s %s", message.wal_end, chr(message.payload[0]))
+        else:
+            logger.debug("%s Raw: %s %s", cls.__name__, message.wal_end, message.data_start)
+            msg = cls(message.payload)
+            logger.info("%s", msg)
+            if cls in _CHANGE_EVENTS:
                 self.n -= 1
-            case "I":
-                print(f"Insert Raw: {message.wal_end} {message.data_start}")
-                msg = Insert(message.payload)
-                print(msg)
-                self.n -= 1
-            case "D":
-                print(f"Delete Raw: {message.wal_end} {message.data_start}")
-                msg = Delete(message.payload)
-                print(msg)
-                self.n -= 1
-            case "C":
-                print(f"Commit Raw: {message.wal_end} {message.data_start}")
-                msg = Commit(message.payload)
-                print(msg)
-            case _:
-                print(f"Skipping message lsn{message.wal_end} {message.payload[:1].decode('utf-8')}")
         if self.n < 0:
+            if self.ack:
+                self._send_feedback(message.cursor, force=True)
             raise StopReplication()
-        
+
         if self.ack:
-            message.cursor.send_feedback(flush_lsn=message.data_start)
+            self._highest_lsn = max(self._highest_lsn, message.data_start)
+            self._since_ack += 1
+            if self._since_ack >= self._ack_every or time.monotonic() - self._last_ack > self._ack_interval:
+                self._send_feedback(message.cursor)
+
+    def _send_feedback(self, cursor, force: bool = False) -> None:
+        # A forced send goes out even with nothing new: earlier unforced sends
+        # are only recorded by psycopg2 until its next status interval.
+        if self._since_ack or (force and self._highest_lsn):
+            cursor.send_feedback(flush_lsn=self._highest_lsn, force=force)
+        self._since_ack = 0
+        self._last_ack = time.monotonic()
 
 
 # if __name__ == "__main__":
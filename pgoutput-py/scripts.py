@@ -1,3 +1,6 @@
+import logging
+import sys
+
 import click
 import psycopg2
 from consumer import *
@@ -18,7 +21,19 @@ def pgoutput_py():
 @click.option("--publication", default="test_pub", help="PostgreSQL publication")
 @click.option("--n", default=5, help="Number of messages to consume")
 @click.option("--peek", is_flag=True, help="Peek at the next message without acking it")
-def advance(host, port, user, password, database, slot, publication, n, peek):
+@click.option("--quiet", is_flag=True, help="Only log warnings and errors")
+@click.option("--sink", type=click.Choice(["stdout", "null"]), default="stdout", help="Where decoder logs go")
+def advance(host, port, user, password, database, slot, publication, n, peek, quiet, sink):
+    consumer_logger = logging.getLogger("consumer")
+    consumer_logger.propagate = False
+    if sink == "null":
+        consumer_logger.addHandler(logging.NullHandler())
+        consumer_logger.setLevel(logging.WARNING)
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        consumer_logger.addHandler(handler)
+        consumer_logger.setLevel(logging.WARNING if quiet else logging.DEBUG)
     connection = psycopg2.connect(
         f"host={host} port={port} user={user} password={password} dbname={database}",
         connection_factory=psycopg2.extras.LogicalReplicationConnection,
@@ -27,7 +42,7 @@ def advance(host, port, user, password, database, slot, publication, n, peek):
     cursor.start_replication(
         slot_name=slot, decode=False, options={"proto_version": 1, "publication_names": publication}
     )
-    cursor.consume_stream(FiniteConsumer(n))
+    FiniteConsumer(n).consume(cursor)
 
 
 pgoutput_py.add_command(advance, name="advance")
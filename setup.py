@@ -1,5 +1,11 @@
 import setuptools
 
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize([setuptools.Extension("_cdecode", ["pgoutput-py/_cdecode.pyx"], optional=True)])
+except ImportError:
+    ext_modules = []
+
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
@@ -15,9 +21,14 @@ setuptools.setup(
     packages=setuptools.find_packages(where="pgoutput-py"),
     include_package_data=True,
     package_dir={"": "pgoutput-py"},
+    ext_modules=ext_modules,
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
+        "Programming Language :: Python :: 3.13",
+        "Programming Language :: Python :: Free Threading",
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
@@ -26,6 +37,9 @@ setuptools.setup(
         "psycopg2-binary",
         "click"
     ],
+    extras_require={
+        "numba": ["numba", "numpy"],
+    },
     entry_points={
         'console_scripts': [
             'pgoutput-py = scripts:pgoutput_py',
@@ -0,0 +1,248 @@
+import os
+import struct
+import subprocess
+import sys
+from array import array
+from datetime import datetime, timezone
+
+import pytest
+
+import consumer
+from consumer import Begin, ColumnData, Commit, Delete, Insert, Relation, RelationColumn, TupleData, Update
+
+BEGIN = b"B\x00\x00\x00\x00\x08\x07\x9c\xf8\x00\x02\x91d\xe0\xfc\xc6\xfe\x00\x00\x08-"
+COMMIT = b"C\x00\x00\x00\x00\x00\x08\x07\x9c\xf8\x00\x00\x00\x00\x08\x07\x9d(\x00\x02\x91d\xe0\xfc\xc6\xfe"
+UPDATE = b"U\x00\x00M\x00N\x00\x1ct\x00\x00\x00\x0292t\x00\x00\x00\x011nnt\x00\x00\x00\x05open1t\x00\x00\x00\x06normalt\x00\x00\x00\x08facebookt\x00\x00\x00\x05emailt\x00\x00\x00\x01ft\x00\x00\x00\x01ft\x00\x00\x00\x015t\x00\x00\x00\x012nt\x00\x00\x00\x17Update credit card infonnt\x00\x00\x00\x02ent\x00\x00\x00\x1a2022-10-31 12:03:06.803033nnnt\x00\x00\x00\x1a2022-10-31 12:03:06.803033t\x00\x00\x00\x1a2022-10-31 12:03:06.803033t\x00\x00\x00\x1a2022-10-31 12:03:06.803033nnt\x00\x00\x01\x86'2':21 'a':19 'account':36 'acme':11B 'ago':23 'but':24 'can':40 'card':3A,7A,31 'credit':2A,6A,30 'curie':10B 'days':22 'expired':38 'has':37 'hi':13 'how':39 'i':14,25,41 'info':4A,8A 'it':44 'marie':9B 'my':35 'on':34 'please':42 'realized':27 'receive':18 'refund':20 'registered':33 'support':12B,16 'thanks':45 'that':28 'thatis':32 'the':29 'to':17 'update':1A,5A,43 've':26 'was':15n"
+
+TOAST = object()
+SCAN_TUPLE = consumer._scan_tuple
+
+
+def encode_tuple(*values) -> bytes:
+    out = struct.pack(">h", len(values))
+    for value in values:
+        if value is None:
+            out += b"n"
+        elif value is TOAST:
+            out += b"u"
+        else:
+            body = value.encode()
+            out += b"t" + struct.pack(">i", len(body)) + body
+    return out
+
+
+def columns(tuple_data) -> list:
+    return [(column.type, column.length, column.value) for column in tuple_data.columns]
+
+
+@pytest.fixture(autouse=True)
+def python_backend(monkeypatch):
+    monkeypatch.setattr(consumer, "_c_read_tuple_data", None)
+    monkeypatch.setattr(consumer, "_scan_tuple", None)
+
+
+def test_begin():
+    msg = Begin(BEGIN)
+    assert msg.lsn == 134716664
+    assert msg.tx_id == 2093
+    assert msg.commit_ts == datetime(2022, 11, 26, 21, 13, 30, 840830, tzinfo=timezone.utc)
+
+
+def test_commit():
+    msg = Commit(COMMIT)
+    assert (msg.flags, msg.lsn, msg.commit_lsn) == (0, 134716664, 134716712)
+    assert msg.commit_ts == datetime(2022, 11, 26, 21, 13, 30, 840830, tzinfo=timezone.utc)
+
+
+def test_relation():
+    payload = (
+        b"R" + struct.pack(">i", 19712) + b"public\x00tickets\x00d" + struct.pack(">h", 2)
+        + b"\x01id\x00" + struct.pack(">Ii", 23, -1)
+        + b"\x00name\x00" + struct.pack(">Ii", 25, -1)
+    )
+    msg = Relation(payload)
+    assert (msg.relation_id, msg.namespace, msg.name, msg.replica_identity) == (19712, "public", "tickets", "d")
+    assert msg.columns == [
+        RelationColumn(flags=1, name="id", type_oid=23, type_modifier=-1),
+        RelationColumn(flags=0, name="name", type_oid=25, type_modifier=-1),
+    ]
+
+
+def test_insert_column_kinds():
+    msg = Insert(b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("42", None, TOAST, "", "żółw"))
+    assert msg.relation_id == 7
+    assert msg.before is None
+    assert msg.after.nr_columns == 5
+    assert columns(msg.after) == [
+        ("text", 2, "42"),
+        ("null", 0, None),
+        ("toast", 0, None),
+        ("text", 0, ""),
+        ("text", 7, "żółw"),
+    ]
+
+
+def test_tuple_data_from_columns():
+    cols = [ColumnData(type="text", length=2, value="hi"), ColumnData(type="null")]
+    td = TupleData(nr_columns=2, columns=cols)
+    assert td.columns == cols
+    assert td == Insert(b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("hi", None)).after
+    assert repr(td) == (
+        "TupleData(nr_columns=2, columns=[ColumnData(type='text', length=2, value='hi'), "
+        "ColumnData(type='null', length=0, value=None)])"
+    )
+
+
+def test_zero_column_tuple_is_truthy():
+    msg = Insert(b"I" + struct.pack(">i", 7) + b"N" + encode_tuple())
+    assert msg.after
+    assert msg.after.columns == []
+
+
+def test_tuple_data_unknown_tag():
+    td = TupleData(nr_columns=1, types=b"b", lengths=array("i", [0]), values=[None])
+    assert td[0].type == "b"
+
+
+def test_update_sample():
+    msg = Update(UPDATE)
+    assert msg.relation_id == 19712
+    assert msg.before is None
+    assert msg.after.nr_columns == 28
+    assert msg.after[0] == ColumnData(type="text", length=2, value="92")
+    assert msg.after[2] == ColumnData(type="null")
+    assert msg.after[26].value.startswith("'2':21 'a':19")
+
+
+@pytest.mark.parametrize("identifier", [b"K", b"O"])
+def test_update_with_old_tuple(identifier):
+    payload = b"U" + struct.pack(">i", 7) + identifier + encode_tuple("1", None) + b"N" + encode_tuple("2", TOAST)
+    msg = Update(payload)
+    assert columns(msg.before) == [("text", 1, "1"), ("null", 0, None)]
+    assert columns(msg.after) == [("text", 1, "2"), ("toast", 0, None)]
+
+
+def test_update_missing_new_tuple_marker():
+    payload = b"U" + struct.pack(">i", 7) + b"K" + encode_tuple("1") + b"X" + encode_tuple("2")
+    with pytest.raises(ValueError):
+        Update(payload)
+
+
+def test_delete():
+    msg = Delete(b"D" + struct.pack(">i", 7) + b"K" + encode_tuple("1", None))
+    assert msg.after is None
+    assert columns(msg.before) == [("text", 1, "1"), ("null", 0, None)]
+
+
+def test_delete_requires_old_tuple():
+    with pytest.raises(ValueError):
+        Delete(b"D" + struct.pack(">i", 7) + b"N" + encode_tuple("1"))
+
+
+def test_text_with_embedded_nul():
+    msg = Insert(b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("a\x00b", "", "c"))
+    assert msg.after.values == ["a\x00b", "", "c"]
+
+
+def test_truncated_text_column():
+    payload = b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("x" * 300)
+    with pytest.raises(ValueError):
+        Insert(payload[:-11])
+
+
+def test_truncated_header():
+    with pytest.raises(struct.error):
+        Begin(BEGIN[:-1])
+
+
+@pytest.mark.skipif(not __debug__, reason="tag checks are stripped under -O")
+def test_wrong_tag():
+    with pytest.raises(ValueError):
+        Begin(COMMIT)
+
+
+def test_tag_check_stripped_with_optimize():
+    # Under -O only the dispatch table guards the tag.
+    script = "import sys; sys.path.insert(0, 'pgoutput-py'); import consumer; consumer.Begin(b'X' + bytes(20))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-O", "-c", script], capture_output=True, cwd=root)
+    assert result.returncode == 0, result.stderr
+
+
+def wide_insert() -> bytes:
+    values = ["%d" % i if i % 4 else None for i in range(40)]
+    values[1], values[2], values[3] = TOAST, "", "żółw"
+    return b"I" + struct.pack(">i", 7) + b"N" + encode_tuple(*values)
+
+
+def test_jit_matches_python(monkeypatch):
+    pytest.importorskip("numba")
+    expected = columns(Insert(wide_insert()).after)
+    monkeypatch.setattr(consumer, "_scan_tuple", SCAN_TUPLE)
+    assert columns(Insert(wide_insert()).after) == expected
+
+
+@pytest.mark.parametrize("cut", [5, 60])
+def test_jit_truncated(monkeypatch, cut):
+    pytest.importorskip("numba")
+    monkeypatch.setattr(consumer, "_scan_tuple", SCAN_TUPLE)
+    with pytest.raises(ValueError):
+        Insert(wide_insert()[:-cut])
+
+
+def test_jit_corrupted_length(monkeypatch):
+    pytest.importorskip("numba")
+    monkeypatch.setattr(consumer, "_scan_tuple", SCAN_TUPLE)
+    payload = bytearray(wide_insert())
+    first_text = payload.index(b"t", 8)
+    payload[first_text + 1:first_text + 5] = struct.pack(">i", 0x7FFFFF00)
+    with pytest.raises(ValueError):
+        Insert(bytes(payload))
+
+
+def test_cdecode_matches_python(monkeypatch):
+    cdecode = pytest.importorskip("_cdecode")
+    payloads = [wide_insert(), UPDATE, b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("a\x00b", None, TOAST, "")]
+    expected = [columns(Insert(b"I" + p[1:]).after) for p in payloads]
+    monkeypatch.setattr(consumer, "_c_read_tuple_data", cdecode.read_tuple_data)
+    assert [columns(Insert(b"I" + p[1:]).after) for p in payloads] == expected
+    assert cdecode.parse_begin(memoryview(BEGIN)) == consumer._S_BEGIN.unpack_from(BEGIN, 1)
+    assert cdecode.parse_commit(memoryview(COMMIT)) == consumer._S_COMMIT.unpack_from(COMMIT, 1)
+
+
+def test_cdecode_truncated():
+    cdecode = pytest.importorskip("_cdecode")
+    payload = b"I" + struct.pack(">i", 7) + b"N" + encode_tuple("x" * 300)
+    with pytest.raises(ValueError):
+        cdecode.read_tuple_data(memoryview(payload[:-11]), 6)
+
+
+def test_parse_payloads_sequential():
+    parsed = consumer.parse_payloads([BEGIN, UPDATE, b"Y\x00", COMMIT], workers=1)
+    assert [type(msg) for msg in parsed] == [Begin, Update, type(None), Commit]
+
+
+def test_parse_payloads_threaded():
+    payloads = [BEGIN, UPDATE, COMMIT] * 20
+    parsed = consumer.parse_payloads(payloads, workers=4)
+    assert [type(msg) for msg in parsed] == [Begin, Update, Commit] * 20
+    assert parsed[1].after.values == Update(UPDATE).after.values
+
+
+def test_parse_payloads_without_gil(monkeypatch):
+    monkeypatch.setattr(consumer, "_gil_enabled", lambda: False)
+    monkeypatch.setattr(consumer.os, "cpu_count", lambda: None)
+    assert [type(msg) for msg in consumer.parse_payloads([BEGIN, COMMIT])] == [Begin, Commit]
+
+
+def test_process_timestamps():
+    np = pytest.importorskip("numpy")
+    ts_microsec = consumer._S_COMMIT.unpack_from(COMMIT, 1)[3]
+    result = consumer.process_timestamps(np.array([0, ts_microsec], dtype=np.int64))
+    assert result.tolist() == [datetime(2000, 1, 1), datetime(2022, 11, 26, 21, 13, 30, 840830)]
+
+
+def test_process_timestamps_without_numpy(monkeypatch):
+    monkeypatch.setattr(consumer, "np", None)
+    with pytest.raises(ImportError):
+        consumer.process_timestamps([0])
@@ -0,0 +1,119 @@
+import pytest
+
+import consumer
+from consumer import FiniteConsumer
+
+from .test_consumer import BEGIN, COMMIT, UPDATE
+
+
+class FakeCursor:
+    def __init__(self, messages=()):
+        self.feedback = []
+        self.messages = list(messages)
+
+    def send_feedback(self, **kwargs):
+        self.feedback.append(kwargs)
+
+    def read_message(self):
+        return self.messages.pop(0) if self.messages else None
+
+
+class FakeMessage:
+    def __init__(self, payload, lsn, cursor):
+        self.payload = payload
+        self.wal_end = lsn
+        self.data_start = lsn
+        self.cursor = cursor
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(consumer.time, "monotonic", clock)
+    return clock
+
+
+def stream(cursor, start=100):
+    # Begin, two updates and a commit per transaction.
+    payloads = [BEGIN, UPDATE, UPDATE, COMMIT] * 3
+    return [FakeMessage(payload, start + i, cursor) for i, payload in enumerate(payloads)]
+
+
+def test_ack_every(clock):
+    cursor = FakeCursor()
+    fc = FiniteConsumer(100, ack=True, ack_every=3)
+    for message in stream(cursor):
+        fc(message)
+    assert [fb["flush_lsn"] for fb in cursor.feedback] == [102, 105, 108, 111]
+    assert not any(fb["force"] for fb in cursor.feedback)
+
+
+def test_ack_interval(clock):
+    cursor = FakeCursor()
+    fc = FiniteConsumer(100, ack=True, ack_every=100, ack_interval=1.0)
+    messages = stream(cursor)
+    for message in messages[:5]:
+        fc(message)
+    assert cursor.feedback == []
+    clock.now = 1.5
+    fc(messages[5])
+    assert [fb["flush_lsn"] for fb in cursor.feedback] == [105]
+
+
+def test_no_feedback_without_ack(clock):
+    cursor = FakeCursor()
+    fc = FiniteConsumer(100, ack_every=1)
+    for message in stream(cursor):
+        fc(message)
+    assert cursor.feedback == []
+
+
+def test_flush_before_stop(clock):
+    cursor = FakeCursor()
+    fc = FiniteConsumer(2, ack=True, ack_every=100)
+    with pytest.raises(consumer.StopReplication):
+        for message in stream(cursor):
+            fc(message)
+    # The third update (lsn 105) stops the stream and is not acknowledged.
+    assert cursor.feedback == [{"flush_lsn": 104, "force": True}]
+
+
+def test_flush_before_stop_after_batch_boundary(clock):
+    cursor = FakeCursor()
+    fc = FiniteConsumer(4, ack=True, ack_every=3)
+    with pytest.raises(consumer.StopReplication):
+        for message in stream(cursor):
+            fc(message)
+    # lsn 108 closed a batch, so nothing is pending, but it must still be forced out.
+    assert cursor.feedback == [
+        {"flush_lsn": 102, "force": False},
+        {"flush_lsn": 105, "force": False},
+        {"flush_lsn": 108, "force": False},
+        {"flush_lsn": 108, "force": True},
+    ]
+
+
+def test_consume_flushes_when_idle(clock, monkeypatch):
+    cursor = FakeCursor()
+    cursor.messages = stream(cursor)[:3]
+    fc = FiniteConsumer(100, ack=True, ack_every=100, ack_interval=1.0)
+    waits = []
+
+    def fake_select(rlist, wlist, xlist, timeout):
+        waits.append(timeout)
+        clock.now += timeout + 0.1
+        if len(waits) == 2:
+            raise consumer.StopReplication()
+        return [], [], []
+
+    monkeypatch.setattr(consumer.select, "select", fake_select)
+    fc.consume(cursor)
+    assert cursor.feedback == [{"flush_lsn": 102, "force": False}]